@@ -3,6 +3,7 @@ from datetime import datetime, timedelta
 from wmf_airflow import DAG
 from airflow.operators.dummy_operator import DummyOperator
 
+from wmf_airflow.spark_sizing import dyn_alloc_conf, max_executors_for_input
 from wmf_airflow.spark_submit import SparkSubmitOperator
 from wmf_airflow.template import YMDH_PARTITION, REPO_PATH, DagConf, eventgate_partitions
 from airflow.sensors.named_hive_partition_sensor import NamedHivePartitionSensor
@@ -17,6 +18,14 @@ default_args = {
 SEARCH_SATISFACTION_TABLE = dag_conf('table_search_satisfaction')
 CIRRUSSEARCH_REQUEST_TABLE = dag_conf('mediawiki_cirrussearch_request')
 
+# Scale executors with the size of the hour being exported. Most hours are
+# small and gain nothing from a larger allocation.
+MAX_EXECUTORS = (
+    '{{ max_executors_for_input(['
+    'dag_conf.table_search_satisfaction, dag_conf.mediawiki_cirrussearch_request], '
+    'year=execution_date.year, month=execution_date.month, '
+    'day=execution_date.day, hour=execution_date.hour) }}')
+
 
 def get_wait_sensor(table: str, sensor_name: str) -> NamedHivePartitionSensor:
     return NamedHivePartitionSensor(
@@ -24,6 +33,11 @@ def get_wait_sensor(table: str, sensor_name: str) -> NamedHivePartitionSensor:
         # We send a failure email every 6 hours and keep trying for a full day.
         timeout=60 * 60 * 6,
         retries=4,
+        # Release the worker slot between pokes instead of holding it for
+        # the full timeout. Partitions arrive hourly, there is no benefit
+        # to checking more than every few minutes.
+        mode='reschedule',
+        poke_interval=60 * 5,
         # temporary sla change to accomodate the catchup, should be reverted afterwards
         sla=timedelta(days=365),
         # Select single hourly partition
@@ -36,13 +50,20 @@ with DAG(
         # min hour day month dow
         schedule_interval='38 * * * *',
         max_active_runs=1,
-        catchup=True
+        catchup=True,
+        user_defined_macros={
+            'dag_conf': dag_conf.macro,
+            'max_executors_for_input': max_executors_for_input,
+        },
 ) as dag:
     export_queries_to_relforge = SparkSubmitOperator(
         task_id='export_queries_to_relforge',
         conf={
             'spark.yarn.maxAppAttempts': 1,
-            'spark.dynamicAllocation.maxExecutors': 10,
+            **dyn_alloc_conf(max_executors=MAX_EXECUTORS),
+            # Hourly batches have few tasks, request half an executor
+            # per pending task slot rather than one each.
+            'spark.dynamicAllocation.executorAllocationRatio': '0.5',
         },
         spark_submit_env_vars={
             'PYSPARK_PYTHON': 'python3.7',
@@ -1,4 +1,5 @@
 from datetime import datetime, timedelta
+import math
 from typing import NewType
 
 from airflow.hooks.hive_hooks import HiveMetastoreHook
@@ -6,11 +7,12 @@ from airflow.operators.dummy_operator import DummyOperator
 
 from wmf_airflow import DAG
 from wmf_airflow.mjolnir import MjolnirOperator
+from wmf_airflow.spark_sizing import dyn_alloc_conf
 from wmf_airflow.swift_upload import SwiftUploadOperator
 
 
 # Set of wikis to train
-from wmf_airflow.template import REPO_PATH
+from wmf_airflow.template import KAFKA_JUMBO_BROKERS, REPO_PATH
 
 WIKIS = [
     'arwiki', 'dewiki', 'enwiki', 'fawiki',
@@ -49,10 +51,7 @@ deploys = {
 
 # Shared CLI args for scripts that talk with kafka
 KAFKA_CLI_ARGS = {
-    'brokers': ','.join([
-        'kafka-jumbo1001.eqiad.wmnet:9092',
-        'kafka-jumbo1002.eqiad.wmnet:9092',
-        'kafka-jumbo1003.eqiad.wmnet:9092']),
+    'brokers': KAFKA_JUMBO_BROKERS,
     'topic-request': 'mjolnir.msearch-prod-request',
     'topic-response': 'mjolnir.msearch-prod-response',
 }
@@ -117,7 +116,13 @@ def dbn(clicks: QueryClicks, clusters: QueryClustering) -> LabeledQueryPage:
         spark_args=dict(conf={
             'spark.executor.cores': 4,
             'spark.executor.memory': '6g',
+            # With adaptive execution this is the number of partitions
+            # shuffles start with, post-shuffle partitions are coalesced
+            # down towards the target input size. Splitting skewed join
+            # partitions (spark.sql.adaptive.skewJoin.*) needs spark 3.
             'spark.sql.shuffle.partitions': 5000,
+            'spark.sql.adaptive.enabled': 'true',
+            'spark.sql.adaptive.shuffle.targetPostShuffleInputSize': '128m',
         }),
         transformer_args={
             'clicks-table': clicks._table,
@@ -191,7 +196,11 @@ def prune_vectors(
             conf={
                 'spark.executor.cores': 2,
                 'spark.executor.memory': '5g',
-                'spark.locality.wait': 0
+                # Briefly prefer node local reads of the input vectors,
+                # without waiting on process or rack locality.
+                'spark.locality.wait': '500ms',
+                'spark.locality.wait.process': '0s',
+                'spark.locality.wait.rack': '0s',
             }),
         transformer_args={
             'feature-vectors-table': vectors._table,
@@ -238,6 +247,39 @@ def make_folds(wiki: str, vectors: FeatureVectors, labels: LabeledQueryPage) ->
     return TrainingFiles(op)
 
 
+# Spark resources for the per-wiki tasks. These are constant across wikis,
+# declare them once rather than per-task.
+HYPERPARAM_NUM_CV_JOBS = 75
+HYPERPARAM_TASK_CPUS = 6
+HYPERPARAM_EXECUTOR_CORES = 6
+HYPERPARAM_SPARK_ARGS = {
+    'driver_memory': '3g',
+    'conf': {
+        'spark.dynamicAllocation.enabled': 'true',
+        'spark.shuffle.service.enabled': 'true',
+        'spark.dynamicAllocation.executorIdleTimeout': '180s',
+        # Tolerate more lost tasks before failing the whole search, a
+        # failed attempt restarts hours of cross-validation.
+        'spark.task.maxFailures': 8,
+        # Allow enough executors to run all cv jobs in parallel
+        **dyn_alloc_conf(max_executors=math.ceil(
+            HYPERPARAM_NUM_CV_JOBS * HYPERPARAM_TASK_CPUS / HYPERPARAM_EXECUTOR_CORES)),
+        'spark.task.cpus': HYPERPARAM_TASK_CPUS,
+        'spark.executor.cores': HYPERPARAM_EXECUTOR_CORES,
+    },
+}
+
+TRAIN_SPARK_ARGS = {
+    'driver_memory': '2g',
+    'conf': {
+        'spark.dynamicAllocation.enabled': 'true',
+        'spark.shuffle.service.enabled': 'true',
+        'spark.task.cpus': 6,
+        'spark.executor.cores': 6,
+    },
+}
+
+
 def hyperparam(training_files: TrainingFiles) -> ModelParameters:
     op = MjolnirOperator(
         task_id='hyperparam-{wikiid}-{labeling_algorithm}-{feature_set}'.format(
@@ -247,13 +289,7 @@ def hyperparam(training_files: TrainingFiles) -> ModelParameters:
         table=TABLES['model_parameters'],
         partition_spec=training_files._partition_spec,
         auto_size_metadata_dir=training_files._output_path,
-        spark_args=dict(
-            driver_memory='3g',
-            conf={
-                'spark.dynamicAllocation.executorIdleTimeout': '180s',
-                'spark.task.cpus': 6,
-                'spark.executor.cores': 6,
-            }),
+        spark_args=HYPERPARAM_SPARK_ARGS,
         transformer_args={
             'training-files-path': training_files._output_path,
             'output-table': TABLES['model_parameters'],
@@ -262,7 +298,7 @@ def hyperparam(training_files: TrainingFiles) -> ModelParameters:
             'initial-num-trees': 100,
             'final-num-trees': 500,
             'iterations': 150,
-            'num-cv-jobs': 75,
+            'num-cv-jobs': HYPERPARAM_NUM_CV_JOBS,
         })
     training_files >> op
     return ModelParameters(op)
@@ -273,6 +309,11 @@ def train(
     model_parameters: ModelParameters,
     remote_feature_set: str
 ) -> TrainedModel:
+    # Each wiki is trained in its own spark application. The train
+    # transformer accepts a single training-files path, and executor memory
+    # overhead is auto-sized from the dimensions of that wiki's feature
+    # matrix. A shared application would have to be sized for the largest
+    # wiki.
     op = MjolnirOperator(
         task_id='train-{wikiid}-{labeling_algorithm}-{feature_set}'.format(
             **dict(training_files._partition_spec)),
@@ -281,12 +322,7 @@ def train(
         partition_spec=training_files._partition_spec,
         marker='_METADATA.JSON',
         auto_size_metadata_dir=training_files._output_path,
-        spark_args=dict(
-            driver_memory='2g',
-            conf={
-                'spark.task.cpus': 6,
-                'spark.executor.cores': 6,
-            }),
+        spark_args=TRAIN_SPARK_ARGS,
         transformer_args={
             'model-parameters-table': model_parameters._table,
             'training-files-path': training_files._output_path,
@@ -298,6 +334,10 @@ def train(
 
 
 def upload(trained_model: TrainedModel) -> SwiftUploadOperator:
+    # Models are uploaded individually, rather than once for all wikis. Each
+    # upload is auto-versioned and announced by its own upload-complete
+    # event, which consumers of the container expect. It also ships each
+    # model as soon as it is trained.
     wiki = trained_model.partition_key('wikiid')
     op = SwiftUploadOperator(
         task_id='upload-{}-{}-{}'.format(
@@ -312,14 +352,42 @@ def upload(trained_model: TrainedModel) -> SwiftUploadOperator:
     return trained_model >> op
 
 
+def train_wiki(
+    wiki: str,
+    vectors: FeatureVectors,
+    labels: LabeledQueryPage,
+    remote_feature_set: str
+) -> SwiftUploadOperator:
+    """Train and ship a model for a single wiki
+
+    The per-wiki pipelines are independent of each other and run
+    concurrently. Only hyperparam, through the sequential pool, is
+    throttled across wikis.
+    """
+    training_files = make_folds(wiki, vectors, labels)
+    model_parameters = hyperparam(training_files)
+    trained_model = train(training_files, model_parameters, remote_feature_set)
+    return upload(trained_model)
+
+
 class HiveTablePath:
+    """Template filter resolving hive tables to their hdfs location
+
+    Locations are cached, a single task renders the same tables into
+    multiple fields and table locations do not change between renders.
+    """
     def __init__(self, metastore_conn_id='metastore_default'):
         self.metastore_conn_id = metastore_conn_id
         self.hook = None
+        self._locations = {}
 
     def __call__(self, qualified_table):
         if qualified_table.startswith('hdfs://'):
             return qualified_table
+        try:
+            return self._locations[qualified_table]
+        except KeyError:
+            pass
         if self.hook is None:
             self.hook = HiveMetastoreHook(self.metastore_conn_id)
         if '.' not in qualified_table:
@@ -328,6 +396,7 @@ class HiveTablePath:
         database_name, table_name = qualified_table.split('.', 2)
         with self.hook.metastore as client:
             table = client.get_table(database_name, table_name)
+        self._locations[qualified_table] = table.sd.location
         return table.sd.location
 
 
@@ -337,6 +406,9 @@ with DAG(
         'start_date': datetime(2020, 1, 8),
         # Defaults used by MjolnirOperator
         'deploys': deploys,
+        # Spark applications are not retried by yarn, see MjolnirOperator,
+        # and each attempt can take hours.
+        'retries': 3,
     },
     schedule_interval=timedelta(days=7),
     # If we don't run for a given week there is no use in re-running it,
@@ -353,10 +425,9 @@ with DAG(
     vectors = prune_vectors(raw_vectors, labels, '{}-pruned_mrmr'.format(FEATURE_SET))
 
     training_complete = DummyOperator(task_id='complete')
+    # Per-wiki tasks are generated statically. Mapping a single set of
+    # tasks over WIKIS requires dynamic task mapping, which is not
+    # available in the deployed airflow 1.10.
     for wiki in WIKIS:
-        training_files = make_folds(wiki, vectors, labels)
-        model_parameters = hyperparam(training_files)
-        trained_model = train(training_files, model_parameters, FEATURE_SET)
-        uploaded = upload(trained_model)
         # Join all wikis back to a single dag entry.
-        uploaded >> training_complete
+        train_wiki(wiki, vectors, labels, FEATURE_SET) >> training_complete
@@ -21,8 +21,9 @@ ingestion and stored in a staging table for the transfer_to_es_weekly
 DAG to pick up.
 """
 from datetime import datetime
+from functools import lru_cache
 import os
-from typing import List, Optional
+from typing import List, Mapping, Optional, Sequence
 
 from airflow.operators.dummy_operator import DummyOperator
 from airflow.operators.python_operator import PythonOperator
@@ -33,6 +34,7 @@ from airflow.sensors.named_hive_partition_sensor import NamedHivePartitionSensor
 from wmf_airflow import DAG
 from wmf_airflow.hdfs_cli import HdfsCliHook
 from wmf_airflow.skein import SkeinOperator
+from wmf_airflow.spark_sizing import dyn_alloc_conf
 from wmf_airflow.spark_submit import SparkSubmitOperator
 from wmf_airflow.template import (
     HTTPS_PROXY, IVY_SETTINGS_PATH, MARIADB_CREDENTIALS_PATH,
@@ -46,6 +48,10 @@ dag_conf = DagConf('ores_predictions_conf')
 INPUT_TABLE = dag_conf('table_mw_rev_score')
 WIKIBASE_ITEM_TABLE = dag_conf('table_wikibase_item')
 
+# The set of wikis to collect from, and where to find the databases
+# for those wikis, is detected through the dblist files.
+DBLISTS = tuple('s{}.dblist'.format(i) for i in range(1, 9))
+
 
 def mw_sql_to_hive(
     task_id: str,
@@ -53,17 +59,28 @@ def mw_sql_to_hive(
     output_partition: str,
     mysql_defaults_path: str = MARIADB_CREDENTIALS_PATH,
     mediawiki_config_repo: str = MEDIAWIKI_CONFIG_PATH,
+    partition_column: Optional[str] = None,
+    bounds_query: Optional[str] = None,
 ) -> SparkSubmitOperator:
-    # The set of wikis to collect from, and where to find the databases
-    # for those wikis, is detected through the dblist files.
-    dblists = ['s{}.dblist'.format(i) for i in range(1, 9)]
     # Local paths to dblists, so we can ship to executor
-    local_dblists = [os.path.join(mediawiki_config_repo, 'dblists', dblist) for dblist in dblists]
+    local_dblists = [os.path.join(mediawiki_config_repo, 'dblists', dblist) for dblist in DBLISTS]
 
     # mysql defaults file to source username / password from. The '#'
     # tells spark to rename to the suffix when placing in working directory.
     mysql_defaults_path += '#mysql.cnf'
 
+    # Integer column of the query results to split reads of large wikis by,
+    # along with a cheap query reporting the range of that column per wiki.
+    if partition_column is None:
+        partition_args: List[str] = []
+    elif bounds_query is None:
+        raise ValueError('bounds_query is required with partition_column')
+    else:
+        partition_args = [
+            '--partition-column', partition_column,
+            '--bounds-query', bounds_query,
+        ]
+
     return SparkSubmitOperator(
         task_id=task_id,
         # Custom environment provides dnspython dependency. The environment must come
@@ -90,7 +107,7 @@ def mw_sql_to_hive(
             # By default ivy will use $HOME/.ivy2, but system users dont have a home
             'spark.jars.ivy': '/tmp/airflow_ivy2',
             # Limit parallelism so we don't try and query 900 databases all at once
-            'spark.dynamicAllocation.maxExecutors': '20',
+            **dyn_alloc_conf(max_executors=20),
             # Don't know exactly where it's used, but we need extra memory or we get
             # high gc and timeouts or yarn killing executors.
             'spark.executor.memoryOverhead': '1g',
@@ -100,10 +117,10 @@ def mw_sql_to_hive(
         application=REPO_PATH + '/spark/mw_sql_to_hive.py',
         application_args=[
             '--mysql-defaults-file', 'mysql.cnf',
-            '--dblists', ','.join(dblists),
+            '--dblists', ','.join(DBLISTS),
             '--query', sql_query,
             '--output-partition', output_partition,
-        ],
+        ] + partition_args,
     )
 
 
@@ -114,23 +131,28 @@ def thresholds_path(model: str) -> str:
 def yesterday_thresholds_path(model: str) -> str:
     # Due to how airflow schedules tasks at the end of a period, to get the daily thresholds
     # for today we use yesterdays date.
+    # Spark ships this through the yarn distributed cache. Node managers
+    # localize it once per user and reuse it across applications, the bulk
+    # ingest fan-out does not re-download it per task.
     yesterday = "{{ macros.ds_format(macros.ds_add(ds, -1), '%Y-%m-%d', '%Y%m%d') }}"
     return dag_conf('thresholds_prefix') + '/' + model + '_' + yesterday + '.json'
 
 
-def fetch_thresholds(model: str):
+def fetch_thresholds(models: Sequence[str]):
     # Fetch per-topic thresholds from ORES to use when deciding which
-    # predictions to discard as not-confident enough.
+    # predictions to discard as not-confident enough. All models are
+    # fetched by a single application.
+    application_args: List[str] = []
+    output_files = {}
+    for model in models:
+        local_path = model + '_thresholds.json'
+        application_args += ['--model', model, '--output-path', local_path]
+        output_files[local_path] = thresholds_path(model)
     return SkeinOperator(
-        task_id='fetch_{}_prediction_thresholds'.format(model),
+        task_id='fetch_prediction_thresholds',
         application=REPO_PATH + '/spark/fetch_ores_thresholds.py',
-        application_args=[
-            '--model', model,
-            '--output-path', 'thresholds.json',
-        ],
-        output_files={
-            'thresholds.json': thresholds_path(model),
-        },
+        application_args=application_args,
+        output_files=output_files,
         # ORES is not available from the analytics network, we need to
         # proxy to the outside world.
         env={
@@ -138,6 +160,7 @@ def fetch_thresholds(model: str):
         })
 
 
+@lru_cache()
 def bulk_partition_spec(model: str, wiki: Optional[str]):
     # Worth noting that the actual partitioning also includes the namespace,
     # but we ignore it. The spark integration will still correctly store
@@ -192,12 +215,20 @@ def bulk_ingest(
 
 
 def extract_predictions(
-    model: str,
+    output_tables: Mapping[str, str],
     input_kind: str,
-    output_table: str,
     source: str,
     propagate_from_wiki: Optional[str],
+    propagate_models: Optional[Sequence[str]] = None,
 ):
+    """Extract predictions of one or more models
+
+    output_tables maps from model name to the table to write that models
+    predictions to. When multiple models are provided the input is read once
+    and shared by all models. propagate_models limits propagation to a subset
+    of the models, by default all models are propagated.
+    """
+    models = list(output_tables.keys())
     if propagate_from_wiki is None:
         propagate_args: List[str] = []
     else:
@@ -207,41 +238,66 @@ def extract_predictions(
             + '/date={{ macros.hive.max_partition(dag_conf.table_wikibase_item).decode("utf8") }}',
             '--propagate-from', propagate_from_wiki,
         ]
+        if propagate_models is not None:
+            propagate_args += ['--propagate-predictions', ','.join(propagate_models)]
+        if input_kind == 'mediawiki_revision_score':
+            # Revision score events cover a small fraction of all pages, prune
+            # the wikibase_item table to the linked pages before grouping it.
+            # The input range spans from the start of the day up to a week
+            # (during catchup), so spark chooses whether to broadcast based on
+            # the estimated size rather than being forced to.
+            propagate_args.append('--prune-wikibase-items')
 
     if input_kind == 'mediawiki_revision_score':
         input_partition = INPUT_TABLE + '/@{{ ds }}/{{ macros.ds_add(ds, 7) }}'
     elif input_kind == 'ores_bulk_ingest':
-        input_partition = bulk_partition_spec(model, None)
+        # Bulk ingest output is partitioned by model
+        if len(models) != 1:
+            raise ValueError('ores_bulk_ingest input supports a single model')
+        input_partition = bulk_partition_spec(models[0], None)
     else:
         raise ValueError('Unknown input_kind: ' + input_kind)
 
-    output_partition = '{table}/{ymdh}/source={source}'.format(
-        table=output_table,
-        ymdh=YMDH_PARTITION,
-        source=source)
+    files = []
+    model_args = []
+    for model, output_table in output_tables.items():
+        thresholds_file = model + '_thresholds.json'
+        files.append(yesterday_thresholds_path(model) + '#' + thresholds_file)
+        model_args += [
+            '--output-partition', '{table}/{ymdh}/source={source}'.format(
+                table=output_table,
+                ymdh=YMDH_PARTITION,
+                source=source),
+            '--thresholds-path', thresholds_file,
+            '--prediction', model,
+        ]
 
     # Extract the data from mediawiki event logs and put into
     # a format suitable for shipping to elasticsearch.
     return SparkSubmitOperator(
-        task_id='extract_{}_predictions'.format(model),
+        task_id='extract_{}_predictions'.format('_'.join(models)),
         conf={
             # Delegate retrys to airflow
             'spark.yarn.maxAppAttempts': '1',
-            'spark.dynamicAllocation.maxExecutors': '20',
+            **dyn_alloc_conf(max_executors=20, min_executors=2),
+            # Request half an executor per pending task slot, hourly
+            # batches finish before a full allocation would start.
+            'spark.dynamicAllocation.executorAllocationRatio': '0.5',
+            # Hourly inputs are small, coalesce the default 200 shuffle
+            # partitions down to fewer reasonably sized tasks.
+            'spark.sql.adaptive.enabled': 'true',
+            'spark.sql.adaptive.shuffle.targetPostShuffleInputSize': '128m',
         },
         spark_submit_env_vars={
             'PYSPARK_PYTHON': 'python3.7',
         },
-        files=yesterday_thresholds_path(model) + '#thresholds.json',
+        files=','.join(files),
         py_files=REPO_PATH + '/spark/wmf_spark.py',
         application=REPO_PATH + '/spark/prepare_mw_rev_score.py',
         application_args=propagate_args + [
             '--input-partition', input_partition,
             '--input-kind', input_kind,
-            '--output-partition', output_partition,
-            '--thresholds-path', 'thresholds.json',
-            '--prediction', model,
-        ],
+        ] + model_args,
     )
 
 
@@ -365,7 +421,15 @@ with DAG(
             FROM page_props
             JOIN page ON page_id = pp_page
             WHERE pp_propname="wikibase_item"
-        """
+        """,
+        partition_column='page_id',
+        # Served from the pp_propname_page index, avoiding a second pass
+        # over the join.
+        bounds_query="""
+            SELECT MIN(pp_page) AS lower, MAX(pp_page) AS upper
+            FROM page_props
+            WHERE pp_propname="wikibase_item"
+        """,
     ) >> DummyOperator(task_id='complete')
 
 
@@ -380,9 +444,7 @@ with DAG(
     max_active_runs=1,
     catchup=True,
 ) as daily_dag:
-    complete = DummyOperator(task_id='complete')
-    fetch_thresholds('articletopic') >> complete
-    fetch_thresholds('drafttopic') >> complete
+    fetch_thresholds(['articletopic', 'drafttopic']) >> DummyOperator(task_id='complete')
 
 
 with DAG(
@@ -405,7 +467,11 @@ with DAG(
         external_task_id='complete',
         # dt is a pendulum.datetime. We need the task for yesterday, because
         # today's task runs at the *end* of the day.
-        execution_date_fn=lambda dt: dt.subtract(days=1).at(hour=0, minute=0, second=0))
+        execution_date_fn=lambda dt: dt.subtract(days=1).at(hour=0, minute=0, second=0),
+        # Release the worker slot between pokes, thresholds are only
+        # fetched once a day.
+        mode='reschedule',
+        poke_interval=60 * 5)
 
     wait_for_hourly_data = NamedHivePartitionSensor(
         task_id='wait_for_hourly_data',
@@ -415,31 +481,24 @@ with DAG(
         timeout=60 * 60 * 6,  # 6 hours
         retries=4,
         email_on_retry=True,
+        # Release the worker slot between pokes instead of holding it for
+        # up to the full timeout.
+        mode='reschedule',
+        poke_interval=60 * 5,
         partition_names=eventgate_partitions(INPUT_TABLE))
 
-    extract_articletopic = extract_predictions(
-        model='articletopic',
+    # Both models are extracted from the same events, read them once.
+    extract = extract_predictions(
+        output_tables={
+            'articletopic': dag_conf('table_articletopic'),
+            'drafttopic': dag_conf('table_drafttopic'),
+        },
         input_kind='mediawiki_revision_score',
-        output_table=dag_conf('table_articletopic'),
         propagate_from_wiki='enwiki',
+        propagate_models=['articletopic'],
         source=hourly_dag.dag_id)
 
-    extract_drafttopic = extract_predictions(
-        model='drafttopic',
-        input_kind='mediawiki_revision_score',
-        output_table=dag_conf('table_drafttopic'),
-        propagate_from_wiki=None,
-        source=hourly_dag.dag_id)
-
-    # list >> list doesn't get the magic, have to have two invocations
-    wait_for_thresholds >> [
-        extract_articletopic,
-        extract_drafttopic,
-    ]
-    wait_for_hourly_data >> [
-        extract_articletopic,
-        extract_drafttopic,
-    ] >> DummyOperator(task_id='complete')
+    [wait_for_thresholds, wait_for_hourly_data] >> extract >> DummyOperator(task_id='complete')
 
 
 with DAG(
@@ -452,6 +511,8 @@ with DAG(
     # This is a full dump and reload of data, running more than one in parallel
     # would be silly.
     max_active_runs=1,
+    # Only one ORES request stream at a time, see bulk_ingest_wikis.
+    concurrency=1,
     user_defined_macros={
         'dag_conf': dag_conf.macro,
     },
@@ -466,25 +527,25 @@ with DAG(
 
     # The ORES api's only allow two connections from a given IP and then start
     # rejecting requests. This means our dump, proxying through a single host,
-    # has to run a single task a time. To keep things simple we use a
-    # straight-line dag to force sequential execution.
-    def bulk_ingest_wikis(last_task, wikis, model, namespaces, error_threshold):
-        for wiki in wikis:
-            # We run a task per namespace to avoid having a single week long task for enwiki
-            # when many namespaces are requested.
-            for namespace in namespaces:
-                last_task = last_task >> bulk_ingest(wiki, model, namespace, error_threshold)
-        return last_task
-
-    last_task = bulk_ingest_wikis(
-        wait_for_thresholds,
+    # has to run a single task a time. The dag is limited to one running task
+    # rather than chaining the tasks, so a failure ingesting one wiki does not
+    # hold back ingestion of the remaining wikis.
+    def bulk_ingest_wikis(wikis, model, namespaces, error_threshold):
+        # We run a task per namespace to avoid having a single week long task for enwiki
+        # when many namespaces are requested.
+        return [
+            bulk_ingest(wiki, model, namespace, error_threshold)
+            for wiki in wikis
+            for namespace in namespaces
+        ]
+
+    ingest = bulk_ingest_wikis(
         wikis=['arwiki', 'cswiki', 'enwiki', 'kowiki', 'testwiki', 'viwiki'],
         model='articletopic',
         namespaces=[0],
         error_threshold=0.001)
 
-    last_task = bulk_ingest_wikis(
-        last_task,
+    ingest += bulk_ingest_wikis(
         wikis=['enwiki'],
         model='drafttopic',
         # TODO: Unclear what the proper set of namespaces is. This is the set of namespaces
@@ -495,18 +556,19 @@ with DAG(
         # to help ensure it finishes eventually.
         error_threshold=0.002)
 
+    bulk_ingest_done = DummyOperator(task_id='bulk_ingest_done')
+    wait_for_thresholds >> ingest >> bulk_ingest_done
+
     extract = [
         extract_predictions(
-            model='articletopic',
+            output_tables={'articletopic': dag_conf('table_articletopic')},
             input_kind='ores_bulk_ingest',
-            output_table=dag_conf('table_articletopic'),
             propagate_from_wiki='enwiki',
             source=bulk_dag.dag_id,
         ),
         extract_predictions(
-            model='drafttopic',
+            output_tables={'drafttopic': dag_conf('table_drafttopic')},
             input_kind='ores_bulk_ingest',
-            output_table=dag_conf('table_drafttopic'),
             propagate_from_wiki=None,
             source=bulk_dag.dag_id,
         ),
@@ -516,4 +578,4 @@ with DAG(
         'ores_bulk_ingest',
         'freq=bulk')
 
-    last_task >> extract >> convert >> upload >> DummyOperator(task_id='complete')
+    bulk_ingest_done >> extract >> convert >> upload >> DummyOperator(task_id='complete')
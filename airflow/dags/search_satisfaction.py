@@ -16,6 +16,7 @@ from wmf_airflow import DAG
 from wmf_airflow.hdfs_cli import HdfsCliHook
 from wmf_airflow.hdfs_to_druid import HdfsToDruidOperator
 from wmf_airflow.hive_partition_range_sensor import HivePartitionRangeSensor
+from wmf_airflow.spark_sizing import dyn_alloc_conf
 from wmf_airflow.spark_submit import SparkSubmitOperator
 from wmf_airflow.template import REPO_PATH, YMD_PARTITION, DagConf, eventgate_partition_range
 
@@ -53,6 +54,9 @@ with DAG(
         task_id='wait_for_events',
         timeout=int(timedelta(days=1).total_seconds()),
         email_on_retry=True,
+        # Waiting can take most of the day, free the worker slot between pokes.
+        mode='reschedule',
+        poke_interval=60 * 5,
         table=TABLE_SEARCH_EVENTS,
         period=timedelta(days=1),
         partition_frequency='hours',
@@ -68,6 +72,8 @@ with DAG(
         task_id='wait_for_logs',
         timeout=int(timedelta(days=1).total_seconds()),
         email_on_retry=True,
+        mode='reschedule',
+        poke_interval=60 * 5,
         table=TABLE_SEARCH_LOGS,
         period=timedelta(days=1),
         partition_frequency='hours',
@@ -80,7 +86,7 @@ with DAG(
             # Defer retrys to airflow
             'spark.yarn.maxAppAttempts': '1',
             'spark.sql.shuffle.partitions': '20',
-            'spark.dynamicAllocation.maxExecutors': '50',
+            **dyn_alloc_conf(max_executors=50),
         },
         spark_submit_env_vars={
             'PYSPARK_PYTHON': 'python3.7',
@@ -100,7 +106,7 @@ with DAG(
         task_id='prepare_json_for_druid',
         conf={
             'spark.yarn.maxAppAttempts': '1',
-            'spark.dynamicAllocation.maxExecutors': '200',
+            **dyn_alloc_conf(max_executors=200),
             # The output needs to be read by the druid user, sharing
             # no groups. Make outputs world-readable.
             'spark.hadoop.fs.permissions.umask-mode': '022',
@@ -1,4 +1,3 @@
-from collections import OrderedDict
 import json
 import os
 from typing import cast, Any, Dict, List, Mapping, Optional, Tuple, TypeVar, Union
@@ -9,15 +8,16 @@ from airflow.utils.decorators import apply_defaults
 from airflow.utils.log.logging_mixin import LoggingMixin
 
 from wmf_airflow.hdfs_cli import HdfsCliHook
+from wmf_airflow.spark_sizing import enforce_dyn_alloc_invariants
 
 _T = TypeVar('_T')
 
 
-KNOWN_TRANSFORMERS = {
+KNOWN_TRANSFORMERS = frozenset({
     'dbn', 'hyperparam', 'norm_query_clustering',
     'train', 'feature_selection', 'make_folds',
     'feature_vectors', 'query_clicks_ltr',
-}
+})
 
 # Executor auto-sizing
 AUTO_DETECT_CONFIG = {
@@ -38,19 +38,46 @@ AUTO_DETECT_CONFIG = {
     }
 }
 
+# Scale of spark memory specification suffixes, in megabytes
+MEMORY_SUFFIX_MB = {
+    'T': 2 ** 20,
+    'G': 2 ** 10,
+    'M': 1,
+}
+
+
+# Spark args that combine, rather than replace, defaults when overridden
+SPARK_ARG_MERGERS = {
+    'conf': lambda a, b: dict(a, **b),
+    'packages': lambda a, b: a + ',' + b,
+    'jars': lambda a, b: a + ',' + b,
+}
+
 
 def _merge_spark_args(default: Mapping, override: Mapping) -> Dict:
     output = dict(default, **override)
-    for key, merger in {
-        'conf': lambda a, b: dict(a, **b),
-        'packages': lambda a, b: a + ',' + b,
-        'jars': lambda a, b: a + ',' + b,
-    }.items():
+    for key, merger in SPARK_ARG_MERGERS.items():
         if key in default and key in override:
             output[key] = merger(default[key], override[key])
     return output
 
 
+def _strip_static_allocation(spark_args: Mapping) -> Dict:
+    """Remove static executor counts when dynamic allocation is enabled
+
+    A static executor count, via num_executors or spark.executor.instances,
+    sets the initial allocation and can prevent dynamic allocation from
+    growing the application. Dynamic allocation is assumed unless explicitly
+    disabled, as auto-sizing only limits spark.dynamicAllocation.maxExecutors.
+    """
+    conf = spark_args.get('conf', {})
+    if str(conf.get('spark.dynamicAllocation.enabled', 'true')).lower() != 'true':
+        return dict(spark_args)
+    output = {k: v for k, v in spark_args.items() if k != 'num_executors'}
+    output['conf'] = {k: v for k, v in conf.items() if k != 'spark.executor.instances'}
+    return output
+
+
 class AutoSizeSpark(LoggingMixin):
     def __init__(
         self,
@@ -77,15 +104,11 @@ class AutoSizeSpark(LoggingMixin):
         if memory.isdigit():
             return int(memory)
 
-        suffixes = {
-            'T': 2 ** 20,
-            'G': 2 ** 10,
-            'M': 1,
-        }
-        for suffix, scale in suffixes.items():
-            if memory[-1].upper() == suffix:
-                return int(memory[:-1]) * scale
-        raise Exception('Unrecognized memory spec: {}'.format(memory))
+        try:
+            scale = MEMORY_SUFFIX_MB[memory[-1:].upper()]
+        except KeyError:
+            raise Exception('Unrecognized memory spec: {}'.format(memory))
+        return int(memory[:-1]) * scale
 
     def _read_metadata(self):
         text_raw = HdfsCliHook.text(os.path.join(
@@ -130,27 +153,36 @@ class AutoSizeSpark(LoggingMixin):
     def apply(self, spark_conf: Mapping) -> Mapping:
         spark_conf = dict(spark_conf)
         if self._transformer in self._config['bytes_per_value']:
-            metadata = self._read_metadata()
-            dim = self._detect_dimensions(metadata)
-            spark_conf['spark.executor.memoryOverhead'] = \
-                self._detect_memory_overhead_mb(dim)
-            self.log.info(
-                'Transformer [{}] with dims [{}] detected memory overhead of [{}] mb'.format(
-                    self._transformer, dim,
+            if 'spark.executor.memoryOverhead' in spark_conf:
+                # Explicit configuration wins, no need to read the metadata.
+                self.log.info('Using provided memory overhead of [{}]'.format(
                     spark_conf['spark.executor.memoryOverhead']))
-
-        spark_conf['spark.dynamicAllocation.maxExecutors'] = \
-            self._limit_max_executors(spark_conf)
-        self.log.info('Detected max executors of {}'.format(
-            spark_conf['spark.dynamicAllocation.maxExecutors']))
-        return spark_conf
+            else:
+                metadata = self._read_metadata()
+                dim = self._detect_dimensions(metadata)
+                spark_conf['spark.executor.memoryOverhead'] = \
+                    self._detect_memory_overhead_mb(dim)
+                self.log.info(
+                    'Transformer [{}] with dims [{}] detected memory overhead of [{}] mb'.format(
+                        self._transformer, dim,
+                        spark_conf['spark.executor.memoryOverhead']))
+
+        # Never allow more than requested, but cap the request to stay within
+        # the configured limits.
+        max_executors = self._limit_max_executors(spark_conf)
+        if 'spark.dynamicAllocation.maxExecutors' in spark_conf:
+            max_executors = min(
+                max_executors, int(spark_conf['spark.dynamicAllocation.maxExecutors']))
+        spark_conf['spark.dynamicAllocation.maxExecutors'] = max_executors
+        self.log.info('Detected max executors of {}'.format(max_executors))
+        return enforce_dyn_alloc_invariants(spark_conf)
 
 
 def _sort_items_recursive(maybe_dict):
     """Recursively sort dictionaries so iteration gives deterministic outputs"""
     if hasattr(maybe_dict, 'items'):
-        items = ((k, _sort_items_recursive(v)) for k, v in maybe_dict.items())
-        return OrderedDict(sorted(items, key=lambda x: x[0]))
+        # dicts preserve insertion order, no need for OrderedDict
+        return {k: _sort_items_recursive(maybe_dict[k]) for k in sorted(maybe_dict)}
     else:
         return maybe_dict
 
@@ -223,7 +255,11 @@ class MjolnirOperator(BaseOperator, LoggingMixin):
         return HdfsCliHook.exists(marker_path)
 
     def _application_args(self, context: Mapping, output_path: str) -> List[str]:
-        """Construct args to be passed to mjolnir python script"""
+        """Construct args to be passed to mjolnir python script
+
+        Called when the task executes, DAG parsing only stores the
+        transformer_args mapping.
+        """
         application_args = [
             # Start with the transformer to invoke
             self._transformer,
@@ -232,8 +268,8 @@ class MjolnirOperator(BaseOperator, LoggingMixin):
             # Arg added by convention to all scripts
             '--output-path', output_path,
         ]
-        # Sort for deterministic output
-        for k, v in sorted(self._transformer_args.items(), key=lambda x: x[0]):
+        # Sort for deterministic output. Keys are unique, the values are never compared.
+        for k, v in sorted(self._transformer_args.items()):
             application_args.append('--' + k)
             # Accepting arrays handles multi-arg, such as: --wiki eswiki ruwiki
             if not isinstance(v, list):
@@ -287,6 +323,7 @@ class MjolnirOperator(BaseOperator, LoggingMixin):
         spark_args = self._default_spark_args()
         if self._spark_args:
             spark_args = _merge_spark_args(spark_args, self._spark_args)
+        spark_args = _strip_static_allocation(spark_args)
 
         auto_size = AutoSizeSpark(
             self._transformer, self._transformer_args.get('wiki'),
@@ -63,8 +63,11 @@ class SkeinHook(BaseHook):
         if not self._output_files:
             return None
         script = []
+        # Overwrite existing outputs. With multiple outputs a failure part way
+        # through leaves the earlier ones in place, a retry must be able to
+        # replace them rather than fail on the existing file.
         for local, remote in self._output_files.items():
-            script.append('hdfs dfs -put {} {}'.format(shlex.quote(local), shlex.quote(remote)))
+            script.append('hdfs dfs -put -f {} {}'.format(shlex.quote(local), shlex.quote(remote)))
         return '\n'.join(script)
 
     def _build_primary_script(self, application: str) -> str:
@@ -0,0 +1,126 @@
+"""Helpers for sizing spark applications
+
+Provides consistent dynamic allocation configuration, along with sizing
+decisions that depend on the data being processed. Decisions depending on
+the data can only be made once the task runs, those functions are intended
+for use as template macros registered with the DAG through
+user_defined_macros, so the decision is made when the task is rendered and
+not when the DAG is parsed.
+"""
+from typing import Any, Dict, Mapping, Optional, Sequence, Tuple, Union
+
+from airflow.hooks.hive_hooks import HiveMetastoreHook
+
+
+# Maximum executors to allow for a given total input size. Each entry is an
+# upper bound of input size, in GiB, and the executors to use up to that
+# size. Inputs larger than the final bucket use the final bucket.
+MAX_EXECUTORS_BY_INPUT_GB: Sequence[Tuple[int, int]] = (
+    (3, 5),
+    (5, 6),
+    (8, 8),
+    (15, 10),
+    (20, 15),
+    (40, 20),
+)
+
+MIN_EXECUTORS = 'spark.dynamicAllocation.minExecutors'
+INITIAL_EXECUTORS = 'spark.dynamicAllocation.initialExecutors'
+MAX_EXECUTORS = 'spark.dynamicAllocation.maxExecutors'
+
+
+def dyn_alloc_conf(
+    max_executors: Union[int, str],
+    min_executors: int = 0,
+    initial_executors: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Spark dynamic allocation bounds satisfying min <= initial <= max
+
+    Spark rejects, or silently adjusts, configurations that violate this
+    invariant. initial_executors defaults to min_executors and is clamped
+    into range. max_executors may be a template, in which case it is checked
+    once rendered by enforce_dyn_alloc_invariants.
+    """
+    if initial_executors is None:
+        initial_executors = min_executors
+    initial_executors = max(initial_executors, min_executors)
+    if isinstance(max_executors, int):
+        if min_executors > max_executors:
+            raise ValueError('minExecutors [{}] must not exceed maxExecutors [{}]'.format(
+                min_executors, max_executors))
+        initial_executors = min(initial_executors, max_executors)
+    return {
+        MIN_EXECUTORS: min_executors,
+        INITIAL_EXECUTORS: initial_executors,
+        MAX_EXECUTORS: max_executors,
+    }
+
+
+def enforce_dyn_alloc_invariants(spark_conf: Mapping) -> Dict[str, Any]:
+    """Clamp rendered dynamic allocation bounds to min <= initial <= max
+
+    Mirrors the checks spark applies when starting the application so
+    misconfiguration fails the task instead of silently starving, or
+    over-allocating, the application.
+    """
+    spark_conf = dict(spark_conf)
+    min_executors = int(spark_conf.get(MIN_EXECUTORS, 0))
+    if MAX_EXECUTORS in spark_conf:
+        max_executors = int(spark_conf[MAX_EXECUTORS])
+        if min_executors > max_executors:
+            raise ValueError('minExecutors [{}] must not exceed maxExecutors [{}]'.format(
+                min_executors, max_executors))
+    else:
+        max_executors = None
+    if INITIAL_EXECUTORS in spark_conf:
+        initial_executors = max(int(spark_conf[INITIAL_EXECUTORS]), min_executors)
+        if max_executors is not None:
+            initial_executors = min(initial_executors, max_executors)
+        spark_conf[INITIAL_EXECUTORS] = initial_executors
+    return spark_conf
+
+
+def hive_partition_bytes(
+    table: str,
+    metastore_conn_id: str = 'metastore_default',
+    **partition_spec: Any
+) -> int:
+    """Total size, in bytes, of all partitions matching a partial spec
+
+    Partition keys of the table that are not provided in partition_spec
+    match any value. For example providing only year, month, day and hour
+    for an eventgate table will report the combined size of the hour across
+    all datacenters.
+    """
+    if '.' not in table:
+        raise ValueError('table must be fully qualified [{}]'.format(table))
+    database_name, table_name = table.split('.', 1)
+    hook = HiveMetastoreHook(metastore_conn_id)
+    with hook.metastore as client:
+        table_meta = client.get_table(database_name, table_name)
+        # The metastore interprets the empty string as a wildcard.
+        part_vals = [str(partition_spec.get(key.name, '')) for key in table_meta.partitionKeys]
+        partitions = client.get_partitions_ps(database_name, table_name, part_vals, -1)
+    return sum(int(p.parameters.get('totalSize', 0)) for p in partitions)
+
+
+def max_executors_for_bytes(total_bytes: int) -> int:
+    """Choose spark.dynamicAllocation.maxExecutors for a total input size"""
+    total_gb = total_bytes / 2 ** 30
+    for limit_gb, max_executors in MAX_EXECUTORS_BY_INPUT_GB:
+        if total_gb <= limit_gb:
+            return max_executors
+    return MAX_EXECUTORS_BY_INPUT_GB[-1][1]
+
+
+def max_executors_for_input(tables: Sequence[str], **partition_spec: Any) -> int:
+    """Template macro choosing maxExecutors from the size of input partitions
+
+    Register in DAG:
+        DAG(..., user_defined_macros={
+            'max_executors_for_input': max_executors_for_input})
+    Access in templates:
+        {{ max_executors_for_input([table_a, table_b], year=execution_date.year) }}
+    """
+    total_bytes = sum(hive_partition_bytes(table, **partition_spec) for table in tables)
+    return max_executors_for_bytes(total_bytes)
@@ -4,6 +4,8 @@ from airflow.contrib.hooks.spark_submit_hook import SparkSubmitHook
 from airflow.models.baseoperator import BaseOperator
 from airflow.utils.decorators import apply_defaults
 
+from wmf_airflow.spark_sizing import enforce_dyn_alloc_invariants
+
 
 class SparkSubmitOperator(BaseOperator):
     """
@@ -89,7 +91,7 @@ class SparkSubmitOperator(BaseOperator):
         """
         # SparkSubmitHook only applies env vars to the master, but we
         # want the executors too for consistency
-        conf = self._conf.copy() if self._conf else {}
+        conf = enforce_dyn_alloc_invariants(self._conf) if self._conf else {}
         if self._env_vars:
             for k, v in self._env_vars.items():
                 conf['spark.executorEnv.{}'.format(k)] = v
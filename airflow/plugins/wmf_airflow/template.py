@@ -61,6 +61,9 @@ MEDIAWIKI_CONFIG_PATH = wmf_conf('mediawiki_config_path')
 # Local path to the analytics/refinery repository on the airflow server
 ANALYTICS_REFINERY_PATH = wmf_conf('analytics_refinery_path')
 
+# Comma separated host:port bootstrap servers for the kafka-jumbo cluster
+KAFKA_JUMBO_BROKERS = wmf_conf('kafka_jumbo_brokers')
+
 # execution date formatted as hive partition with year=/month=/day=/hour=
 YMDH_PARTITION = \
     'year={{ execution_date.year }}/month={{ execution_date.month }}/' \
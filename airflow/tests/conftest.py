@@ -15,6 +15,7 @@ from airflow.models.variable import Variable
 
 import jinja2
 import pytest
+import wmf_airflow.spark_sizing
 
 import findspark
 findspark.init()  # must happen before importing pyspark
@@ -222,6 +223,9 @@ def rendered_task(task, mocker):
     # This will try and talk to hive, can't let it. And yes, it really
     # returns a binary string.
     mocker.patch.object(macros.hive, 'max_partition').return_value = b'20010115'
+    # Input sizing also talks to hive. Report inputs larger than any sizing
+    # bucket so rendered tasks reflect their largest possible allocation.
+    mocker.patch.object(wmf_airflow.spark_sizing, 'hive_partition_bytes').return_value = 2 ** 40
     # This will change the task, take a copy
     task = deepcopy(task)
     # Some dags have expectations, such as it always runs on sunday. Some date manipulation
@@ -224,7 +224,9 @@ def test_bash_commandline_against_fixture(task, fixture_factory, mocker):
 
 
 @pytest.mark.parametrize('task', tasks(SparkSubmitOperator))
-def test_spark_submit_sizing(task, mocker):
+def test_spark_submit_sizing(rendered_task, mocker):
+    # Sizing may be templated, check the rendered values.
+    task = rendered_task
     assert 'spark.dynamicAllocation.maxExecutors' in task._conf, \
         "spark.dynamicAllocation.maxExecutors should be set"
     max_exec = int(task._conf['spark.dynamicAllocation.maxExecutors'])
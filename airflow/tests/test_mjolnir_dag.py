@@ -68,3 +68,42 @@ def test_spark_submit_cli_args_against_fixtures(mocker, fixture_factory, task):
     fixture = '{}_{}'.format(task.dag_id, task.task_id)
     comparer = fixture_factory('spark_submit_hook', fixture)
     comparer(command)
+
+
+def test_static_allocation_stripped_with_dynamic_allocation():
+    spark_args = {
+        'num_executors': 10,
+        'conf': {'spark.executor.instances': '10', 'spark.executor.cores': '2'},
+    }
+    stripped = wmf_airflow.mjolnir._strip_static_allocation(spark_args)
+    assert stripped == {'conf': {'spark.executor.cores': '2'}}
+
+    spark_args['conf']['spark.dynamicAllocation.enabled'] = 'false'
+    assert wmf_airflow.mjolnir._strip_static_allocation(spark_args) == spark_args
+
+
+@pytest.mark.parametrize('memory,expected', [
+    (512, 512),
+    ('512', 512),
+    ('512M', 512),
+    ('2g', 2048),
+    ('1T', 2 ** 20),
+])
+def test_parse_memory_to_mb(memory, expected):
+    assert wmf_airflow.mjolnir.AutoSizeSpark._parse_memory_to_mb(memory) == expected
+
+
+def test_parse_memory_to_mb_rejects_unknown_suffix():
+    with pytest.raises(Exception):
+        wmf_airflow.mjolnir.AutoSizeSpark._parse_memory_to_mb('2k')
+
+
+def test_auto_size_respects_provided_memory_overhead(mocker):
+    read_metadata = mocker.patch.object(wmf_airflow.mjolnir.AutoSizeSpark, '_read_metadata')
+    auto_size = wmf_airflow.mjolnir.AutoSizeSpark('train', None, 'hdfs://pytest/metadata')
+    conf = auto_size.apply({
+        'spark.executor.memory': '2g',
+        'spark.executor.memoryOverhead': '1g',
+    })
+    assert conf['spark.executor.memoryOverhead'] == '1g'
+    read_metadata.assert_not_called()
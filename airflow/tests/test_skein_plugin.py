@@ -20,3 +20,22 @@ def test_skein_spec_against_fixtures(fixture_factory, rendered_task):
     fixture = '{}-{}'.format(task.dag_id, task.task_id)
     comparer = fixture_factory('skein_operator_spec', fixture)
     comparer(spec.to_dict())
+
+
+def test_output_copy_overwrites_for_retries():
+    # A retry after a partial upload must replace, not trip over, the
+    # outputs copied by the failed attempt.
+    task = SkeinOperator(
+        task_id='output_copy_overwrites',
+        application='pytest.py',
+        output_files={
+            'a.json': 'hdfs:///pytest/a.json',
+            'b.json': 'hdfs:///pytest/b.json',
+        })
+    script = task._make_hook()._build_script(task._application)
+    assert script.split('\n') == [
+        'set -o errexit',
+        'python3 pytest.py',
+        'hdfs dfs -put -f a.json hdfs:///pytest/a.json',
+        'hdfs dfs -put -f b.json hdfs:///pytest/b.json',
+    ]
@@ -0,0 +1,83 @@
+from airflow.hooks.hive_hooks import HiveMetastoreHook
+
+import pytest
+import wmf_airflow.spark_sizing
+from wmf_airflow.spark_sizing import (
+    dyn_alloc_conf, enforce_dyn_alloc_invariants, hive_partition_bytes,
+    max_executors_for_bytes, max_executors_for_input)
+
+
+GB = 2 ** 30
+
+
+@pytest.mark.parametrize('total_bytes,expected', [
+    (0, 5),
+    (3 * GB, 5),
+    (3 * GB + 1, 6),
+    (8 * GB, 8),
+    (12 * GB, 10),
+    (40 * GB, 20),
+    (400 * GB, 20),
+])
+def test_max_executors_for_bytes(total_bytes, expected):
+    assert max_executors_for_bytes(total_bytes) == expected
+
+
+def test_hive_partition_bytes(mocker):
+    client = mocker.patch.object(HiveMetastoreHook, 'get_metastore_client')().__enter__()
+    key_names = ['datacenter', 'year', 'month', 'day', 'hour']
+    client.get_table().partitionKeys = [mocker.Mock() for _ in key_names]
+    for key, name in zip(client.get_table().partitionKeys, key_names):
+        key.name = name
+    client.get_partitions_ps.return_value = [
+        mocker.Mock(parameters={'totalSize': '100'}),
+        mocker.Mock(parameters={'totalSize': '23'}),
+    ]
+
+    total = hive_partition_bytes('pytest.table', year=2038, month=1, day=17, hour=3)
+
+    assert total == 123
+    client.get_partitions_ps.assert_called_once_with(
+        'pytest', 'table', ['', '2038', '1', '17', '3'], -1)
+
+
+def test_max_executors_for_input_sums_tables(mocker):
+    partition_bytes = mocker.patch.object(wmf_airflow.spark_sizing, 'hive_partition_bytes')
+    partition_bytes.return_value = 4 * GB
+    assert max_executors_for_input(['a.b', 'c.d'], hour=1) == 8
+    partition_bytes.assert_called_with('c.d', hour=1)
+
+
+@pytest.mark.parametrize('kwargs,expected', [
+    (dict(max_executors=10), (0, 0, 10)),
+    (dict(max_executors=10, min_executors=2), (2, 2, 10)),
+    (dict(max_executors=10, initial_executors=50), (0, 10, 10)),
+    (dict(max_executors=10, min_executors=3, initial_executors=1), (3, 3, 10)),
+    (dict(max_executors='{{ tmpl }}', initial_executors=50), (0, 50, '{{ tmpl }}')),
+])
+def test_dyn_alloc_conf(kwargs, expected):
+    conf = dyn_alloc_conf(**kwargs)
+    assert expected == (
+        conf['spark.dynamicAllocation.minExecutors'],
+        conf['spark.dynamicAllocation.initialExecutors'],
+        conf['spark.dynamicAllocation.maxExecutors'])
+
+
+def test_dyn_alloc_conf_rejects_min_above_max():
+    with pytest.raises(ValueError):
+        dyn_alloc_conf(max_executors=1, min_executors=2)
+
+
+def test_enforce_dyn_alloc_invariants():
+    conf = enforce_dyn_alloc_invariants({
+        'spark.dynamicAllocation.initialExecutors': '50',
+        'spark.dynamicAllocation.maxExecutors': '10',
+    })
+    assert conf['spark.dynamicAllocation.initialExecutors'] == 10
+    # Unrelated configuration passes through
+    assert enforce_dyn_alloc_invariants({'a': 'b'}) == {'a': 'b'}
+    with pytest.raises(ValueError):
+        enforce_dyn_alloc_invariants({
+            'spark.dynamicAllocation.minExecutors': '11',
+            'spark.dynamicAllocation.maxExecutors': '10',
+        })
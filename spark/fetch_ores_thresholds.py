@@ -7,6 +7,7 @@ https://gist.github.com/halfak/630dc3fd811995c2a0260d43da462645
 """
 
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
 import json
 import logging
 import requests
@@ -30,6 +31,11 @@ PRECISION_TARGETS = [0.7, 0.5, 0.3, 0.15]
 # Default threshold to use if none of the precision targets can be satisfied
 DEFAULT_THRESHOLD = 0.9
 
+# Number of wikis to query thresholds for concurrently. The ORES api's only
+# allow two connections from a given IP and then start rejecting requests,
+# see the bulk ingest DAG in airflow/dags/ores_predictions.py.
+MAX_CONCURRENT_WIKIS = 2
+
 Config = NamedTuple('Config', [
     ('wiki', str),
     ('model', str),
@@ -39,28 +45,37 @@ Config = NamedTuple('Config', [
 
 def arg_parser() -> ArgumentParser:
     parser = ArgumentParser()
-    parser.add_argument('--model', required=True)
-    parser.add_argument('--output-path', required=True)
+    # Thresholds for multiple models can be fetched by repeating --model
+    # and --output-path, in matching order.
+    parser.add_argument('--model', required=True, action='append')
+    parser.add_argument('--output-path', required=True, action='append')
     parser.add_argument('--ores-host', default='https://ores.wikimedia.org')
     return parser
 
 
 def main(
-    model: str,
-    output_path: str,
+    model: Sequence[str],
+    output_path: Sequence[str],
     ores_host: str
 ) -> int:
+    if len(model) != len(output_path):
+        raise Exception('Each model requires an output path')
     ores_scores_api = ores_host + PATH
-    thresholds = get_all_thresholds(establish_session(), model, ores_scores_api)
-    with open(output_path, 'wt') as f:
-        json.dump(thresholds, f)
+    # All models share a session, and its connection to ores
+    http = establish_session()
+    for model_name, model_output_path in zip(model, output_path):
+        thresholds = get_all_thresholds(http, model_name, ores_scores_api)
+        with open(model_output_path, 'wt') as f:
+            json.dump(thresholds, f)
 
     return 0
 
 
 def establish_session():
     http = requests.Session()
-    retries = Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
+    # Concurrent requests may still be throttled, allow enough retries and backoff
+    # (~2 minutes total) to wait out a 429.
+    retries = Retry(total=6, backoff_factor=2, status_forcelist=[429, 500, 502, 503, 504])
     http.mount("http://", TimeoutHTTPAdapter(max_retries=retries))
     http.mount("https://", TimeoutHTTPAdapter(max_retries=retries))
     return http
@@ -105,21 +120,29 @@ def get_threshold_at_precision(http: requests.Session,
         return None
 
 
+def get_wiki_thresholds(http: requests.Session, config: Config) -> Mapping[str, float]:
+    """Assemble prediction thresholds for all labels of configured model and wiki"""
+    label_thresholds = cast(Dict[str, float], {})
+    for label in get_labels(http, config):
+        for target in PRECISION_TARGETS:
+            optimization = get_threshold_at_precision(http, config, label, target)
+            if optimization is not None and optimization['recall'] >= 0.5:
+                label_thresholds[label] = optimization['threshold']
+                break
+        else:
+            label_thresholds[label] = DEFAULT_THRESHOLD
+    return label_thresholds
+
+
 def get_all_thresholds(http: requests.Session, model: str, ores_scores_api: str) -> Mapping[str, Mapping[str, float]]:
     """Assemble prediction thresholds for all labels of configured model"""
-    label_thresholds = cast(Dict[str, Dict[str, float]], {})
-    for wiki in get_supported_wikis(http, model, ores_scores_api):
-        label_thresholds[wiki] = {}
-        config = Config(wiki, model, ores_scores_api + '/' + wiki)
-        for label in get_labels(http, config):
-            for target in PRECISION_TARGETS:
-                optimization = get_threshold_at_precision(http, config, label, target)
-                if optimization is not None and optimization['recall'] >= 0.5:
-                    label_thresholds[wiki][label] = optimization['threshold']
-                    break
-            else:
-                label_thresholds[wiki][label] = DEFAULT_THRESHOLD
-    return label_thresholds
+    configs = [Config(wiki, model, ores_scores_api + '/' + wiki)
+               for wiki in get_supported_wikis(http, model, ores_scores_api)]
+    # Requests are latency bound, spread the wikis over a few threads
+    # sharing the session's connection pool.
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_WIKIS) as pool:
+        wiki_thresholds = pool.map(lambda config: get_wiki_thresholds(http, config), configs)
+        return {config.wiki: thresholds for config, thresholds in zip(configs, wiki_thresholds)}
 
 
 #  Taken from https://findwork.dev/blog/advanced-usage-python-requests-timeouts-retries-hooks
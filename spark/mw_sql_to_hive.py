@@ -10,7 +10,7 @@ from configparser import ConfigParser
 from datetime import datetime
 import logging
 import sys
-from typing import Mapping, Sequence, Tuple
+from typing import Mapping, Optional, Sequence, Tuple
 
 import dns.resolver
 from pyspark.sql import SparkSession, DataFrame, functions as F
@@ -21,6 +21,10 @@ from wmf_spark import HivePartitionWriter
 # These wikis dont seem to load properly, and are very special case wikis
 EXCLUDE_WIKIS = {'labswiki', 'labtestwiki'}
 
+# Width of the partition column range, such as page ids, to read per
+# partition when partitioning reads of a single wiki.
+JDBC_IDS_PER_PARTITION = 1000000
+
 
 def arg_parser() -> ArgumentParser:
     def date(val: str) -> datetime:
@@ -44,6 +48,17 @@ def arg_parser() -> ArgumentParser:
     parser.add_argument(
         '--num-output-partitions', type=int, default=20,
         help='Number of partitions to write to hdfs. Estimate value based on 100MB per partition')
+    parser.add_argument(
+        '--partition-column', default=None,
+        help='Integer column of the query results to split reads of large wikis by')
+    parser.add_argument(
+        '--bounds-query', default=None,
+        help='SQL query returning the range of --partition-column in each wiki as '
+             'columns lower and upper. Should be index backed, it runs against every wiki')
+    parser.add_argument(
+        '--max-partitions-per-wiki', type=int, default=8,
+        help='Maximum number of concurrent reads of a single wiki when '
+             '--partition-column is provided')
     return parser
 
 
@@ -145,6 +160,20 @@ class WikiDbQuery:
             .withColumn('wikiid', F.lit(dbname))
         )
 
+    def partitioned_query(self, dbname, query, column, lower, upper, num_partitions):
+        # spark does not allow partitioning the query option, provide
+        # the query as a derived table instead.
+        return (
+            self._reader(dbname)
+            .option('dbtable', '({}) AS q'.format(query))
+            .option('partitionColumn', column)
+            .option('lowerBound', str(lower))
+            .option('upperBound', str(upper))
+            .option('numPartitions', str(num_partitions))
+            .load()
+            .withColumn('wikiid', F.lit(dbname))
+        )
+
 
 def union_all_df(dfs: Sequence[DataFrame]) -> DataFrame:
     """Union together any number of DataFrames
@@ -167,13 +196,36 @@ def union_all_df(dfs: Sequence[DataFrame]) -> DataFrame:
             dfs[0].schema)
 
 
+def num_jdbc_partitions(lower: int, upper: int, max_partitions: int) -> int:
+    """Number of reads to split a partition column range into"""
+    return max(1, min(max_partitions, (upper - lower) // JDBC_IDS_PER_PARTITION))
+
+
+def query_bounds(
+    loader: WikiDbQuery, wikis: Sequence[str], bounds_query: str
+) -> Mapping[str, Tuple[int, int]]:
+    """Range of the partition column in each wiki
+
+    Queries all wikis in a single spark job. bounds_query must return
+    a single row with lower and upper columns. Wikis with no results are
+    not included in the returned mapping.
+    """
+    rows = union_all_df([loader.query(dbname, bounds_query) for dbname in wikis]).collect()
+    return {row.wikiid: (row.lower, row.upper) for row in rows if row.lower is not None}
+
+
 def main(
     mysql_defaults_file: str,
     dblists: Sequence[str],
     query: str,
     output_partition: HivePartitionWriter,
-    num_output_partitions: int
+    num_output_partitions: int,
+    partition_column: Optional[str],
+    bounds_query: Optional[str],
+    max_partitions_per_wiki: int,
 ) -> int:
+    if (partition_column is None) != (bounds_query is None):
+        raise ValueError('--partition-column and --bounds-query must be provided together')
     dbname_mapping = get_mediawiki_section_dbname_mapping(dblists)
     with open(mysql_defaults_file, 'rt') as f:
         user, password = get_mysql_options_file_user_pass(f.read())
@@ -181,7 +233,21 @@ def main(
     loader = WikiDbQuery(spark, dbname_mapping, user, password)
 
     wikis = [dbname for dbname in dbname_mapping.keys() if dbname not in EXCLUDE_WIKIS]
-    per_wiki_dfs = [loader.query(dbname, query) for dbname in wikis]
+    if partition_column is None or bounds_query is None:
+        per_wiki_dfs = [loader.query(dbname, query) for dbname in wikis]
+    else:
+        # Split reads of the largest wikis so they do not run as a single
+        # long task after all other wikis have completed.
+        bounds = query_bounds(loader, wikis, bounds_query)
+        per_wiki_dfs = []
+        for dbname in wikis:
+            lower, upper = bounds.get(dbname, (0, 0))
+            num_partitions = num_jdbc_partitions(lower, upper, max_partitions_per_wiki)
+            if num_partitions == 1:
+                per_wiki_dfs.append(loader.query(dbname, query))
+            else:
+                per_wiki_dfs.append(loader.partitioned_query(
+                    dbname, query, partition_column, lower, upper, num_partitions))
 
     # If we don't repartition the output we will have 1 per source database, most
     # of those will be tiny wikis with very few rows, and then a few giants like
@@ -19,6 +19,7 @@ import logging
 import sys
 from typing import cast, Callable, Mapping, Optional, Sequence, Set
 
+from pyspark import StorageLevel
 from pyspark.sql import (
     SparkSession, Column, DataFrame, Row, Window,
     functions as F, types as T)
@@ -87,7 +88,10 @@ def propagate_by_wbitem(
     source_wikis: Set[str],
     # Wiki to propagate prediction from. If no prediction is available from this
     # wiki then no scores are propagated.
-    preferred_wiki: str
+    preferred_wiki: str,
+    # Prune the wikibase side to pages linked from the predictions before
+    # grouping it. Worthwhile when few pages have predictions.
+    prune_wikibase_items: bool = False,
 ) -> DataFrame:
     """Propagate predictions from source wiki to all wikis
 
@@ -97,6 +101,11 @@ def propagate_by_wbitem(
     the predictions about the item itself. There should never be more than
     perhaps 1k items on either side, so the row size should be capped at a
     reasonable level.
+
+    With prune_wikibase_items the predictions select the wikibase items they
+    link to, and then the pages of those items, before grouping. No join
+    strategy is forced, spark broadcasts the pruning side only when its
+    estimated size is under spark.sql.autoBroadcastJoinThreshold.
     """
     def resolve_propagation(
         predictions: Sequence[Row],
@@ -138,8 +147,19 @@ def propagate_by_wbitem(
     df_predictions = df_predictions.select(
         'wikiid', 'page_id', 'page_namespace', prediction_col)
 
+    if prune_wikibase_items:
+        df_wikibase_linked = df_wikibase.join(
+            df_predictions.select('wikiid', 'page_id'),
+            how='left_semi', on=['wikiid', 'page_id'])
+        df_wikibase_pages = df_wikibase.join(
+            df_wikibase_linked.select('wikibase_item').distinct(),
+            how='left_semi', on=['wikibase_item'])
+    else:
+        df_wikibase_linked = df_wikibase
+        df_wikibase_pages = df_wikibase
+
     df_pages_by_link = (
-        df_wikibase
+        df_wikibase_pages
         .groupBy('wikibase_item')
         .agg(F.collect_list(F.struct('wikiid', 'page_id', 'page_namespace')).alias('pages'))
     )
@@ -151,7 +171,7 @@ def propagate_by_wbitem(
         # identifying a unique page. In the rare case they vary (perhaps a page
         # move) we shouldn't throw out the prediction, so drop page_namespace
         # from df being joined.
-        .join(df_wikibase.drop('page_namespace'), how='left', on=['wikiid', 'page_id'])
+        .join(df_wikibase_linked.drop('page_namespace'), how='left', on=['wikiid', 'page_id'])
         # Not every prediction will have a wikibase_item, but we don't want
         # to pull them into a single giant row. Assign fake wikibase_item strings
         # that are unique per prediction to avoid skew.
@@ -210,6 +230,10 @@ def extract_prediction(
     )
 
 
+# Columns of mediawiki/revision/score events used by load_mediawiki_revision_score
+REVISION_SCORE_COLUMNS = ['database', 'page_id', 'page_namespace', 'rev_timestamp', 'scores']
+
+
 def load_mediawiki_revision_score(
     df: DataFrame, prediction: str
 ) -> DataFrame:
@@ -260,6 +284,9 @@ def arg_parser() -> ArgumentParser:
         with open(file_path, 'r') as f:
             return json.load(f)
 
+    def csv(val: str) -> Sequence[str]:
+        return val.split(',')
+
     parser = ArgumentParser()
     parser.add_argument(
         '--input-partition', required=True, type=HivePartitionTimeRange.from_spec,
@@ -268,17 +295,19 @@ def arg_parser() -> ArgumentParser:
     parser.add_argument(
         '--input-kind', required=True, choices=list(INPUT_KINDS.keys()),
         help='The format of the input to read')
+    # Multiple predictions can be extracted from a single input by repeating
+    # --prediction, --output-partition and --thresholds-path, in matching order.
     parser.add_argument(
-        '--output-partition', required=True, type=HivePartitionWriter.from_spec,
+        '--output-partition', required=True, type=HivePartitionWriter.from_spec, action='append',
         help='Table and partition to write prepared predictions to')
     parser.add_argument(
-        '--thresholds-path', dest='thresholds', type=json_path, required=True,
+        '--thresholds-path', dest='thresholds', type=json_path, required=True, action='append',
         help='Path to json file containing per-wiki/topic thresholds to apply')
     parser.add_argument(
-        '--prediction', required=True,
+        '--prediction', required=True, action='append',
         help='Name of model to extract predictions of')
     parser.add_argument(
-        '--alias', default=None, required=False,
+        '--alias', default=None, required=False, action='append',
         help='Name of prediction column in output table. Model name will be used if not provided.')
     parser.add_argument(
         '--wikibase-item-partition', required=False, type=HivePartition.from_spec,
@@ -287,6 +316,13 @@ def arg_parser() -> ArgumentParser:
     parser.add_argument(
         '--propagate-from', required=False,
         help='Wiki database name to propagate predictions from.')
+    parser.add_argument(
+        '--propagate-predictions', required=False, type=csv, default=None,
+        help='csv of predictions to propagate. All predictions are propagated if not provided.')
+    parser.add_argument(
+        '--prune-wikibase-items', action='store_true', default=False,
+        help='Limit the wikibase_item table to pages linked from the predictions '
+             'before propagating. Appropriate when few pages have predictions.')
     # We "know" that the data is relatively small so make a single output
     # partition, with the option to override for larger one-off tasks.
     parser.add_argument(
@@ -295,28 +331,26 @@ def arg_parser() -> ArgumentParser:
     return parser
 
 
-def main(
-    input_partition: HivePartitionTimeRange,
+def prepare_prediction(
+    df_input: DataFrame,
     input_kind: str,
-    output_partition: HivePartitionWriter,
     # Thresholds is expected to contain a two level dict. top level must be
     # keyed by mediawiki database name, second level must be a mapping
     # from predicted label to minimum acceptable threshold. Unlisted
     # wikis / labels recieve DEFAULT_THRESHOLD
     thresholds: Mapping[str, Mapping[str, float]],
     prediction: str,
-    alias: str,
-    wikibase_item_partition: Optional[HivePartition],
+    alias: Optional[str],
+    df_wikibase: Optional[DataFrame],
     propagate_from: Optional[str],
+    prune_wikibase_items: bool,
     num_output_partitions: int
-) -> int:
+) -> DataFrame:
+    """Prepare a single prediction of the input for elasticsearch ingestion"""
     if propagate_from is not None and propagate_from not in thresholds:
         raise Exception('No thresholds provided for propagation wiki, no propagation can occur.')
 
-    spark = SparkSession.builder.getOrCreate()
-
-    df_in = INPUT_KINDS[input_kind](
-        input_partition.read(spark), prediction)
+    df_in = INPUT_KINDS[input_kind](df_input, prediction)
 
     # Find appropriate data, convert into expected formats
     df_predictions = extract_prediction(df_in, prediction, thresholds)
@@ -332,22 +366,23 @@ def main(
     # Propagate predictions from wikis we have models to all the other
     # wikis by wikibase_item.
     if propagate_from is not None:
-        if wikibase_item_partition is None:
+        if df_wikibase is None:
             raise Exception('propagate_from provided without wikibase_item_table')
 
         df_predictions = propagate_by_wbitem(
             df_predictions,
-            wikibase_item_partition.read(spark),
+            df_wikibase,
             prediction_col,
             source_wikis=set(thresholds.keys()),
-            preferred_wiki=propagate_from)
-    elif wikibase_item_partition is not None:
+            preferred_wiki=propagate_from,
+            prune_wikibase_items=prune_wikibase_items)
+    elif df_wikibase is not None:
         logging.warning('wikibase_item_table provided without propagate_from, no propagation will occur')
 
     # Repartition as desired, spark typically has hundreds of partitions but
     # the final outputs may be anywhere from hundreds of MB to dozens of GB
     # depending on the input dataset.
-    df_out = df_predictions \
+    return df_predictions \
         .repartition(num_output_partitions) \
         .select(
             'wikiid',
@@ -355,7 +390,52 @@ def main(
             F.col('page_namespace').cast('int'),
             prediction_col)
 
-    output_partition.overwrite_with(df_out)
+
+def main(
+    input_partition: HivePartitionTimeRange,
+    input_kind: str,
+    output_partition: Sequence[HivePartitionWriter],
+    thresholds: Sequence[Mapping[str, Mapping[str, float]]],
+    prediction: Sequence[str],
+    alias: Optional[Sequence[str]],
+    wikibase_item_partition: Optional[HivePartition],
+    propagate_from: Optional[str],
+    propagate_predictions: Optional[Sequence[str]],
+    prune_wikibase_items: bool,
+    num_output_partitions: int
+) -> int:
+    aliases: Sequence[Optional[str]] = [None] * len(prediction) if alias is None else alias
+    if not len(prediction) == len(output_partition) == len(thresholds) == len(aliases):
+        raise Exception('Each prediction requires an output partition, thresholds and alias')
+    if propagate_predictions is None:
+        propagate_predictions = prediction
+
+    spark = SparkSession.builder.getOrCreate()
+
+    df_input = input_partition.read(spark)
+    if len(prediction) > 1:
+        if input_kind != 'mediawiki_revision_score':
+            raise Exception('Multiple predictions can only be extracted from mediawiki_revision_score')
+        # Each prediction is extracted from the same events, read them
+        # once instead of once per prediction.
+        df_input = df_input.select(*REVISION_SCORE_COLUMNS) \
+            .persist(StorageLevel.MEMORY_AND_DISK)
+
+    if wikibase_item_partition is None:
+        df_wikibase = None
+    else:
+        df_wikibase = wikibase_item_partition.read(spark)
+
+    for pred, pred_alias, pred_output, pred_thresholds in zip(
+        prediction, aliases, output_partition, thresholds
+    ):
+        propagate = pred in propagate_predictions
+        df_out = prepare_prediction(
+            df_input, input_kind, pred_thresholds, pred, pred_alias,
+            df_wikibase if propagate else None,
+            propagate_from if propagate else None,
+            prune_wikibase_items, num_output_partitions)
+        pred_output.overwrite_with(df_out)
     return 0
 
 
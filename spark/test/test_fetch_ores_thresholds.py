@@ -73,3 +73,16 @@ def test_threshold_selection_logic(mocker):
 
     thresholds = fetch_ores_thresholds.get_all_thresholds(Session(), 'pytestmodel', 'https://ores.pytest/v3/scores')
     assert thresholds == {'pytestwiki': expect}
+
+
+def test_all_thresholds_keyed_by_wiki(mocker):
+    def get_labels(http_session, config):
+        return [config.wiki + '_label']
+
+    mocker.patch.object(fetch_ores_thresholds, 'get_threshold_at_precision').return_value = None
+    mocker.patch.object(fetch_ores_thresholds, 'get_labels').side_effect = get_labels
+    wikis = ['{}wiki'.format(i) for i in range(10)]
+    mocker.patch.object(fetch_ores_thresholds, 'get_supported_wikis').return_value = wikis
+
+    thresholds = fetch_ores_thresholds.get_all_thresholds(Session(), 'pytestmodel', 'https://ores.pytest/v3/scores')
+    assert thresholds == {wiki: {wiki + '_label': 0.9} for wiki in wikis}
@@ -1,5 +1,7 @@
 import itertools
 
+import pytest
+
 import mw_sql_to_hive
 
 
@@ -37,3 +39,13 @@ def test_union_all_happy_path(spark):
     # Chain is equiv to union
     expect = itertools.chain(*[range(num_rows) for _ in range(num_dfs)])
     assert sorted([r.id for r in rows]) == sorted(expect)
+
+
+@pytest.mark.parametrize('lower,upper,expected', [
+    (0, 0, 1),
+    (1, 999999, 1),
+    (1, 3000001, 3),
+    (1, 70000000, 8),
+])
+def test_num_jdbc_partitions(lower, upper, expected):
+    assert mw_sql_to_hive.num_jdbc_partitions(lower, upper, max_partitions=8) == expected
@@ -62,6 +62,7 @@ def test_top_row_per_group(spark):
     assert len(results) == len(set(results))
 
 
+@pytest.mark.parametrize('prune_wikibase_items', [False, True])
 @pytest.mark.parametrize('predictions,wbitems,expected', [
     [
         # predictions
@@ -96,7 +97,7 @@ def test_top_row_per_group(spark):
         }
     ]
 ])
-def test_propagate_by_wbitem(spark, predictions, wbitems, expected):
+def test_propagate_by_wbitem(spark, predictions, wbitems, expected, prune_wikibase_items):
     df_predictions = spark.createDataFrame(predictions, T.StructType([
         T.StructField('wikiid', T.StringType()),
         T.StructField('page_id', T.IntegerType()),
@@ -116,9 +117,29 @@ def test_propagate_by_wbitem(spark, predictions, wbitems, expected):
 
     results = prepare_mw_rev_score.propagate_by_wbitem(
         df_predictions, df_wbitem, 'prediction',
-        source_wikis, preferred_wiki
+        source_wikis, preferred_wiki, prune_wikibase_items
     ).collect()
     results = [(r.wikiid, r.page_id, r.page_namespace, tuple(r.prediction)) for r in results]
 
     assert set(results) == expected
     assert len(results) == len(set(results))
+
+
+def test_arg_parser_accepts_multiple_predictions(tmp_path):
+    thresholds_path = tmp_path / 'thresholds.json'
+    thresholds_path.write_text('{"pytestwiki": {"good": 0.5}}')
+    args = prepare_mw_rev_score.arg_parser().parse_args([
+        '--input-partition', 'pytest.input/@2021-01-01/2021-01-02',
+        '--input-kind', 'mediawiki_revision_score',
+        '--output-partition', 'pytest.first/k=v',
+        '--thresholds-path', str(thresholds_path),
+        '--prediction', 'first',
+        '--output-partition', 'pytest.second/k=v',
+        '--thresholds-path', str(thresholds_path),
+        '--prediction', 'second',
+        '--propagate-predictions', 'first',
+    ])
+    assert args.prediction == ['first', 'second']
+    assert len(args.output_partition) == 2
+    assert args.thresholds == [{'pytestwiki': {'good': 0.5}}] * 2
+    assert args.propagate_predictions == ['first']